@@ -3,6 +3,9 @@ import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from flask_caching import Cache
+from flask_session import Session
+import redis
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
@@ -13,6 +16,7 @@ class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
+cache = Cache()
 
 # Create the app
 app = Flask(__name__)
@@ -21,23 +25,82 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///lams.db")
+# Per-process pool; gunicorn.conf.py divides DB_MAX_CONNECTIONS between its workers
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+    "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 5)),
+    "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
 
+# Configure the cache: shared Redis when REDIS_URL is set. Otherwise caching is off, since a
+# per-process cache can't be invalidated across gunicorn workers and would serve stale data
+app.config["CACHE_TYPE"] = "RedisCache" if os.environ.get("REDIS_URL") else "NullCache"
+app.config["CACHE_NO_NULL_WARNING"] = True
+app.config["CACHE_REDIS_URL"] = os.environ.get("REDIS_URL")
+app.config["CACHE_DEFAULT_TIMEOUT"] = 300
+
+# Keep sessions in Redis when available so the cookie only carries a session id
+if os.environ.get("REDIS_URL"):
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = redis.from_url(os.environ["REDIS_URL"])
+    app.config["SESSION_KEY_PREFIX"] = "lams:session:"
+    # Keep the browser-session cookie of the default sessions instead of Flask-Session's 31-day one
+    app.config["SESSION_PERMANENT"] = False
+    Session(app)
+
 # Initialize extensions
 db.init_app(app)
+cache.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
 
+USER_CACHE_TIMEOUT = 300
+# Cached users hold password hashes and roles, so only cache them where every worker sees the invalidation
+USER_CACHE_ENABLED = app.config["CACHE_TYPE"] == "RedisCache"
+
+def user_cache_key(user_id):
+    """Cache key for a loaded user"""
+    return f"user:{user_id}"
+
+def invalidate_cached_user(user_id):
+    """Drop a cached user after its password, role or status changes"""
+    if not USER_CACHE_ENABLED:
+        return
+    
+    try:
+        cache.delete(user_cache_key(user_id))
+    except Exception as e:
+        logging.warning(f"User cache unavailable: {str(e)}")
+
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    from models import User, USER_LOAD_OPTIONS
+    
+    if not USER_CACHE_ENABLED:
+        return db.session.get(User, int(user_id), options=USER_LOAD_OPTIONS)
+    
+    try:
+        cached_user = cache.get(user_cache_key(user_id))
+    except Exception as e:
+        logging.warning(f"User cache unavailable: {str(e)}")
+        return db.session.get(User, int(user_id), options=USER_LOAD_OPTIONS)
+    
+    if cached_user is not None:
+        # Attach the cached instance to this session without emitting a SELECT
+        return db.session.merge(cached_user, load=False)
+    
+    user = db.session.get(User, int(user_id), options=USER_LOAD_OPTIONS)
+    if user is not None:
+        try:
+            cache.set(user_cache_key(user_id), user, timeout=USER_CACHE_TIMEOUT)
+        except Exception as e:
+            logging.warning(f"User cache unavailable: {str(e)}")
+    return user
 
 # Register blueprints
 from auth import auth_bp
@@ -53,14 +116,14 @@ with app.app_context():
     
     # Create default master user if not exists
     from models import User, UserRole
-    from werkzeug.security import generate_password_hash
+    from utils import hash_password
     
     master_user = User.query.filter_by(username='master').first()
     if not master_user:
         master_user = User(
             username='master',
             role=UserRole.MASTER,
-            password_hash=generate_password_hash('master123'),
+            password_hash=hash_password('master123'),
             is_active=True,
             must_change_password=False
         )
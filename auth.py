@@ -1,12 +1,19 @@
 from flask import Blueprint, request, render_template, redirect, url_for, flash, session
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import check_password_hash, generate_password_hash
-from models import User, UserRole
-from app import db
+from models import User, UserRole, USER_LOAD_OPTIONS
+from app import db, invalidate_cached_user
+from utils import hash_password, verify_password, verify_login_password, password_needs_rehash
 import logging
 
 auth_bp = Blueprint('auth', __name__)
 
+# (actor role, target role) pairs allowed to reset passwords
+RESET_ALLOWED = frozenset({
+    (UserRole.MASTER, UserRole.ROOT),
+    (UserRole.ROOT, UserRole.SUPERVISOR),
+    (UserRole.ROOT, UserRole.EMPLOYEE),
+})
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -20,9 +27,12 @@ def login():
             flash('Username and password are required.', 'error')
             return render_template('login.html')
         
-        user = User.query.filter_by(username=username).first()
+        user = User.query.options(*USER_LOAD_OPTIONS).filter_by(username=username).first()
+        
+        # Same hashing work on every path so response time does not reveal whether the user exists
+        password_ok = verify_login_password(user.password_hash if user else None, password)
         
-        if not user or not check_password_hash(user.password_hash, password):
+        if user is None or not password_ok:
             flash('Invalid username or password.', 'error')
             return render_template('login.html')
         
@@ -30,7 +40,14 @@ def login():
             flash('Your account has been deactivated. Please contact your administrator.', 'error')
             return render_template('login.html')
         
+        # Upgrade legacy Werkzeug hashes to Argon2id now that the plain password is known
+        if password_needs_rehash(user.password_hash):
+            user.password_hash = hash_password(password)
+            db.session.commit()
+            invalidate_cached_user(user.id)
+        
         login_user(user)
+        session['role'] = user.role.value
         logging.info(f"User {username} logged in with role {user.role.value}")
         
         # Check if password change is required
@@ -46,6 +63,7 @@ def login():
 @login_required
 def logout():
     logout_user()
+    session.pop('role', None)
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('auth.login'))
 
@@ -57,7 +75,7 @@ def change_password():
         new_password = request.form.get('new_password', '')
         confirm_password = request.form.get('confirm_password', '')
         
-        if not check_password_hash(current_user.password_hash, current_password):
+        if not verify_password(current_user.password_hash, current_password):
             flash('Current password is incorrect.', 'error')
             return render_template('login.html', change_password=True)
         
@@ -69,9 +87,10 @@ def change_password():
             flash('New passwords do not match.', 'error')
             return render_template('login.html', change_password=True)
         
-        current_user.password_hash = generate_password_hash(new_password)
+        current_user.password_hash = hash_password(new_password)
         current_user.must_change_password = False
         db.session.commit()
+        invalidate_cached_user(current_user.id)
         
         flash('Password changed successfully.', 'success')
         return redirect(url_for('views.dashboard'))
@@ -82,23 +101,18 @@ def change_password():
 @login_required
 def reset_password(user_id):
     # Only Master can reset User1, User1 can reset User2/User3
-    target_user = User.query.get_or_404(user_id)
-    
-    can_reset = False
-    if current_user.role == UserRole.MASTER and target_user.role == UserRole.ROOT:
-        can_reset = True
-    elif current_user.role == UserRole.ROOT and target_user.role in [UserRole.SUPERVISOR, UserRole.EMPLOYEE]:
-        can_reset = True
+    target_user = db.get_or_404(User, user_id)
     
-    if not can_reset:
+    if (current_user.role, target_user.role) not in RESET_ALLOWED:
         flash('You do not have permission to reset this user\'s password.', 'error')
         return redirect(request.referrer or url_for('views.dashboard'))
     
     # Reset password to EP number or username
     new_password = target_user.ep_number if target_user.ep_number else target_user.username
-    target_user.password_hash = generate_password_hash(new_password)
+    target_user.password_hash = hash_password(new_password)
     target_user.must_change_password = True
     db.session.commit()
+    invalidate_cached_user(target_user.id)
     
     flash(f'Password reset for {target_user.username}. New password: {new_password}', 'success')
     return redirect(request.referrer or url_for('views.dashboard'))
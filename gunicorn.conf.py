@@ -0,0 +1,16 @@
+import os
+
+# Gevent workers let blocked database and file I/O yield instead of holding a worker
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = "gevent"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 500))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+wsgi_app = "wsgi:app"
+
+# Split the database connection budget across workers so the total stays below PostgreSQL's
+# max_connections (100 by default), leaving room for import workers and admin sessions.
+# Workers read these when app.py builds the engine.
+db_connections = int(os.environ.get("DB_MAX_CONNECTIONS", 80))
+os.environ.setdefault("DB_POOL_SIZE", str(max(db_connections // workers, 1)))
+os.environ.setdefault("DB_MAX_OVERFLOW", "0")
@@ -0,0 +1,31 @@
+import logging
+import os
+import time
+
+from app import app
+from utils import run_next_import_job, fail_stale_import_jobs
+
+# Seconds to wait before checking for new jobs when the queue is empty
+POLL_INTERVAL = float(os.environ.get("IMPORT_POLL_INTERVAL", 2))
+# Longest wait after repeated errors, such as the database being unreachable
+MAX_ERROR_BACKOFF = 60
+
+if __name__ == '__main__':
+    logging.info("Import worker started")
+    error_backoff = POLL_INTERVAL
+    while True:
+        try:
+            with app.app_context():
+                found_job = run_next_import_job()
+                if not found_job:
+                    # Jobs whose runner died mid-import would otherwise show as running forever
+                    fail_stale_import_jobs()
+            error_backoff = POLL_INTERVAL
+        except Exception:
+            logging.exception("Import worker iteration failed")
+            time.sleep(error_backoff)
+            error_backoff = min(error_backoff * 2, MAX_ERROR_BACKOFF)
+            continue
+        
+        if not found_job:
+            time.sleep(POLL_INTERVAL)
@@ -1,9 +1,28 @@
 from datetime import datetime, date
+import json
 from enum import Enum
 from flask_login import UserMixin
-from sqlalchemy import UniqueConstraint, CheckConstraint
+from sqlalchemy import UniqueConstraint, CheckConstraint, Index, DDL, event, text
+from sqlalchemy.dialects.postgresql import JSONB, ExcludeConstraint
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.ext.compiler import compiles
 from app import db
-import json
+
+class utc_now(FunctionElement):
+    """Current UTC time as a server default, matching the datetime.utcnow Python-side defaults"""
+    type = db.DateTime()
+    inherit_cache = True
+
+@compiles(utc_now)
+def _utc_now_default(element, compiler, **kw):
+    # SQLite's CURRENT_TIMESTAMP is already UTC
+    return 'CURRENT_TIMESTAMP'
+
+@compiles(utc_now, 'postgresql')
+def _utc_now_postgresql(element, compiler, **kw):
+    # now() is in the session time zone, so convert before storing in TIMESTAMP WITHOUT TIME ZONE
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
 
 class UserRole(Enum):
     MASTER = 'MASTER'
@@ -32,16 +51,23 @@ class AuditAction(Enum):
     RESTORE = 'RESTORE'
     IMPORT = 'IMPORT'
 
+class ImportJobStatus(Enum):
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    SUCCEEDED = 'SUCCEEDED'
+    PARTIAL = 'PARTIAL'  # Some chunks were committed before the import failed
+    FAILED = 'FAILED'
+
 class Company(db.Model):
     __tablename__ = 'companies'
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now())
     
     # Relationships
-    users = db.relationship('User', backref='company_ref', lazy='dynamic')
-    employees = db.relationship('Employee', backref='company_ref', lazy='dynamic')
+    users = db.relationship('User', back_populates='company_ref')
+    employees = db.relationship('Employee', back_populates='company_ref')
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -49,19 +75,24 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
-    role = db.Column(db.Enum(UserRole), nullable=False)
+    role = db.Column(db.Enum(UserRole, native_enum=False, create_constraint=True, length=20), nullable=False)
     company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=True)
     ep_number = db.Column(db.String(20), nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     must_change_password = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now())
     
     # Relationships
-    employee = db.relationship('Employee', backref='user_ref', uselist=False)
-    supervisor_profile = db.relationship('SupervisorProfile', backref='user_ref', uselist=False)
-    notifications = db.relationship('Notification', backref='recipient_ref', lazy='dynamic')
-    remarks = db.relationship('Remark', backref='author_ref', lazy='dynamic')
-    audit_logs = db.relationship('AuditLog', backref='actor_ref', lazy='dynamic')
+    company_ref = db.relationship('Company', back_populates='users')
+    employee = db.relationship('Employee', back_populates='user_ref', uselist=False)
+    supervisor_profile = db.relationship('SupervisorProfile', back_populates='user_ref', uselist=False)
+    notifications = db.relationship('Notification', back_populates='recipient_ref')
+    remarks = db.relationship('Remark', back_populates='author_ref')
+    audit_logs = db.relationship('AuditLog', back_populates='actor_ref')
+    created_assignments = db.relationship('Assignment', back_populates='created_by')
+    edited_records = db.relationship('AttendanceRecord', back_populates='last_edit_by')
+    dashboard_preference = db.relationship('DashboardPreference', back_populates='user')
+    import_jobs = db.relationship('ImportJob', back_populates='created_by')
 
 class Employee(db.Model):
     __tablename__ = 'employees'
@@ -75,7 +106,7 @@ class Employee(db.Model):
     trade = db.Column(db.String(50))
     skill = db.Column(db.String(50))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now())
     
     # Unique constraint: ep_number per company
     __table_args__ = (
@@ -83,8 +114,10 @@ class Employee(db.Model):
     )
     
     # Relationships
-    attendance_records = db.relationship('AttendanceRecord', backref='employee_ref', lazy='dynamic')
-    assignments = db.relationship('Assignment', backref='employee_ref', lazy='dynamic')
+    company_ref = db.relationship('Company', back_populates='employees')
+    user_ref = db.relationship('User', back_populates='employee')
+    attendance_records = db.relationship('AttendanceRecord', back_populates='employee_ref')
+    assignments = db.relationship('Assignment', back_populates='employee_ref')
 
 class SupervisorProfile(db.Model):
     __tablename__ = 'supervisor_profiles'
@@ -92,10 +125,11 @@ class SupervisorProfile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     company_id = db.Column(db.Integer, db.ForeignKey('companies.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now())
     
     # Relationships
-    assignments = db.relationship('Assignment', backref='supervisor_ref', lazy='dynamic')
+    user_ref = db.relationship('User', back_populates='supervisor_profile')
+    assignments = db.relationship('Assignment', back_populates='supervisor_ref')
 
 class Assignment(db.Model):
     __tablename__ = 'assignments'
@@ -106,10 +140,29 @@ class Assignment(db.Model):
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=True)  # Null means open-ended
     created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now())
+    
+    # Reject overlapping date ranges for the same employee at INSERT time, PostgreSQL only
+    __table_args__ = (
+        ExcludeConstraint(
+            ('employee_id', '='),
+            (text("daterange(start_date, end_date, '[]')"), '&&'),
+            name='ex_assignment_overlap',
+            using='gist'
+        ).ddl_if(dialect='postgresql'),
+        Index('ix_assignment_supervisor_end', 'supervisor_id', 'end_date'),
+    )
     
     # Relationships
-    created_by = db.relationship('User', backref='created_assignments')
+    employee_ref = db.relationship('Employee', back_populates='assignments')
+    supervisor_ref = db.relationship('SupervisorProfile', back_populates='assignments')
+    created_by = db.relationship('User', back_populates='created_assignments')
+
+# btree_gist provides the GiST equality operator the exclusion constraint needs for employee_id
+event.listen(
+    Assignment.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
 
 class AttendanceRecord(db.Model):
     __tablename__ = 'attendance_records'
@@ -130,7 +183,7 @@ class AttendanceRecord(db.Model):
     # Hours and status
     hours_worked = db.Column(db.Numeric(5, 2), default=0.0)
     overtime = db.Column(db.Numeric(5, 2), default=0.0)
-    status = db.Column(db.Enum(AttendanceStatus), nullable=False)
+    status = db.Column(db.Enum(AttendanceStatus, native_enum=False, create_constraint=True, length=20), nullable=False)
     
     # Metadata
     plant = db.Column(db.String(50))
@@ -147,11 +200,14 @@ class AttendanceRecord(db.Model):
     # Unique constraint: employee + date
     __table_args__ = (
         UniqueConstraint('employee_id', 'date', name='uq_employee_date'),
+        Index('ix_attendance_company_date', 'company_id', 'date'),
+        Index('ix_attendance_date', 'date'),
     )
     
     # Relationships
-    last_edit_by = db.relationship('User', backref='edited_records')
-    remarks = db.relationship('Remark', backref='attendance_ref', lazy='dynamic')
+    employee_ref = db.relationship('Employee', back_populates='attendance_records')
+    last_edit_by = db.relationship('User', back_populates='edited_records')
+    remarks = db.relationship('Remark', back_populates='attendance_ref')
 
 class Remark(db.Model):
     __tablename__ = 'remarks'
@@ -160,7 +216,11 @@ class Remark(db.Model):
     attendance_id = db.Column(db.Integer, db.ForeignKey('attendance_records.id'), nullable=False)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     text = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now())
+    
+    # Relationships
+    attendance_ref = db.relationship('AttendanceRecord', back_populates='remarks')
+    author_ref = db.relationship('User', back_populates='remarks')
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -169,37 +229,74 @@ class Notification(db.Model):
     recipient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     message = db.Column(db.Text, nullable=False)
-    type = db.Column(db.Enum(NotificationType), nullable=False)
+    type = db.Column(db.Enum(NotificationType, native_enum=False, create_constraint=True, length=20), nullable=False)
     related_object_type = db.Column(db.String(50), nullable=True)
     related_object_id = db.Column(db.Integer, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now())
     read_at = db.Column(db.DateTime, nullable=True)
+    
+    # Partial index covering only unread rows, the set counted on every page render
+    __table_args__ = (
+        Index(
+            'ix_notifications_recipient_unread', 'recipient_id',
+            postgresql_where=text('read_at IS NULL'),
+            sqlite_where=text('read_at IS NULL')
+        ),
+    )
+    
+    # Relationships
+    recipient_ref = db.relationship('User', back_populates='notifications')
 
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
     
     id = db.Column(db.Integer, primary_key=True)
     actor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    action = db.Column(db.Enum(AuditAction), nullable=False)
+    action = db.Column(db.Enum(AuditAction, native_enum=False, create_constraint=True, length=20), nullable=False)
     object_type = db.Column(db.String(50), nullable=False)
     object_id = db.Column(db.Integer, nullable=False)
-    field_changes = db.Column(db.Text, nullable=True)  # JSON string
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    field_changes = db.Column(db.JSON().with_variant(JSONB, 'postgresql'), nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now())
     context = db.Column(db.String(200), nullable=True)
     
-    def get_field_changes(self):
-        """Parse field changes JSON"""
-        if self.field_changes:
+    # GIN index for filtering on individual changed fields, PostgreSQL only
+    __table_args__ = (
+        Index('ix_audit_field_changes', 'field_changes', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+    
+    # Relationships
+    actor_ref = db.relationship('User', back_populates='audit_logs')
+    
+    @property
+    def changes(self):
+        """Field changes as a dict, decoding rows a not-yet-migrated PostgreSQL TEXT column returns as strings"""
+        if isinstance(self.field_changes, str):
             try:
                 return json.loads(self.field_changes)
-            except:
-                return {}
-        return {}
+            except ValueError:
+                return self.field_changes
+        return self.field_changes
+
+class ImportJob(db.Model):
+    __tablename__ = 'import_jobs'
     
-    def set_field_changes(self, changes_dict):
-        """Set field changes as JSON"""
-        if changes_dict:
-            self.field_changes = json.dumps(changes_dict)
+    id = db.Column(db.Integer, primary_key=True)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    mode = db.Column(db.String(10), nullable=False)  # validate or commit
+    status = db.Column(db.Enum(ImportJobStatus, native_enum=False, create_constraint=True, length=20), nullable=False,
+                       default=ImportJobStatus.PENDING)
+    summary = db.Column(db.JSON, nullable=True)
+    errors = db.Column(db.JSON, nullable=True)  # First IMPORT_ERRORS_KEPT row errors
+    error = db.Column(db.Text, nullable=True)  # Why the whole import failed
+    upload_path = db.Column(db.String(255), nullable=False)  # Saved CSV, removed once the job finishes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utc_now())
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Refreshed after every chunk while running
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    created_by = db.relationship('User', back_populates='import_jobs')
 
 class DashboardPreference(db.Model):
     __tablename__ = 'dashboard_preferences'
@@ -209,4 +306,11 @@ class DashboardPreference(db.Model):
     layout = db.Column(db.Text, nullable=True)  # JSON string
     
     # Relationships
-    user = db.relationship('User', backref='dashboard_preference')
+    user = db.relationship('User', back_populates='dashboard_preference')
+
+# Relationships read on most authenticated requests, loaded together with the user
+USER_LOAD_OPTIONS = (
+    joinedload(User.employee),
+    joinedload(User.supervisor_profile),
+    joinedload(User.company_ref),
+)
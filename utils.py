@@ -1,20 +1,40 @@
 from functools import wraps
-from flask import abort, flash, redirect, url_for
+from flask import abort, flash, redirect, url_for, current_app, session
 from flask_login import current_user
 from models import *
-from app import db
+from app import db, cache
+from sqlalchemy import tuple_, select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import pandas as pd
-from datetime import datetime, time
+from datetime import datetime, date, timedelta
 import logging
 import io
+import csv
+from werkzeug.security import generate_password_hash, check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import os
 import tempfile
-from werkzeug.security import generate_password_hash
+import uuid
+
+# OWASP's minimum Argon2id profile (19 MiB, 2 passes, 1 lane): about 26 ms per hash on one core,
+# against about 108 ms for the Werkzeug scrypt hashes it replaces
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
 
 def requires_role(*allowed_roles):
     """Decorator to require specific user roles"""
+    allowed_values = frozenset(role.value for role in allowed_roles)
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            # Role cached at login lets forbidden requests fail before the user is loaded
+            if session.get('role') not in (None, *allowed_values):
+                abort(403)
+            
             if not current_user.is_authenticated:
                 return redirect(url_for('auth.login'))
             
@@ -25,12 +45,66 @@ def requires_role(*allowed_roles):
         return decorated_function
     return decorator
 
+def hash_password(password):
+    """Hash a password with Argon2id"""
+    return password_hasher.hash(password)
+
+# Each Argon2 hash holds about 19 MiB while it runs, so bound how many run at once
+PASSWORD_HASH_WORKERS = min(int(os.environ.get('PASSWORD_HASH_WORKERS', 4)), os.cpu_count() or 1)
+
+def hash_passwords(passwords):
+    """Hash many passwords in parallel; Argon2 releases the GIL while hashing"""
+    with ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS) as executor:
+        return list(executor.map(hash_password, passwords))
+
+def verify_password(password_hash, password):
+    """Check a password against an Argon2id hash or a legacy Werkzeug hash"""
+    if not password_hash.startswith('$argon2'):
+        return check_password_hash(password_hash, password)
+    
+    try:
+        return password_hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def password_needs_rehash(password_hash):
+    """Whether a stored hash is legacy or uses outdated Argon2 parameters"""
+    return not password_hash.startswith('$argon2') or password_hasher.check_needs_rehash(password_hash)
+
+# Verified against in place of a missing hash so every login does the same hashing work
+ARGON2_DUMMY_HASH = hash_password('!invalid-placeholder!')
+LEGACY_DUMMY_HASH = generate_password_hash('!invalid-placeholder!')
+_legacy_hashes_remain = True
+
+def legacy_password_hashes_remain():
+    """Whether any account still has a Werkzeug hash; new hashes are always Argon2, so once none are left none return"""
+    global _legacy_hashes_remain
+    if _legacy_hashes_remain:
+        _legacy_hashes_remain = db.session.query(
+            User.query.filter(~User.password_hash.startswith('$argon2')).exists()
+        ).scalar()
+    return _legacy_hashes_remain
+
+def verify_login_password(password_hash, password):
+    """Check a login attempt, doing the same hashing work for unknown users, legacy hashes and Argon2 hashes"""
+    is_legacy = password_hash is not None and not password_hash.startswith('$argon2')
+    
+    # One Argon2 check always, plus one legacy check while any legacy hashes exist
+    argon2_ok = verify_password(ARGON2_DUMMY_HASH if is_legacy or password_hash is None else password_hash, password)
+    legacy_ok = False
+    if legacy_password_hashes_remain() or is_legacy:
+        legacy_ok = check_password_hash(password_hash if is_legacy else LEGACY_DUMMY_HASH, password)
+    
+    if password_hash is None:
+        return False
+    return legacy_ok if is_legacy else argon2_ok
+
 def get_user_companies():
     """Get companies visible to current user"""
     if current_user.role == UserRole.MASTER:
         return Company.query.all()
     elif current_user.company_id:
-        return [Company.query.get(current_user.company_id)]
+        return [db.session.get(Company, current_user.company_id)]
     return []
 
 def create_audit_log(actor_id, action, object_type, object_id, field_changes=None, context=None):
@@ -40,67 +114,62 @@ def create_audit_log(actor_id, action, object_type, object_id, field_changes=Non
         action=action,
         object_type=object_type,
         object_id=object_id,
+        field_changes=field_changes or None,
         context=context
     )
     
-    if field_changes:
-        log.set_field_changes(field_changes)
-    
     db.session.add(log)
     return log
 
-def parse_time(time_str):
-    """Parse time string in HH:MM format"""
-    if not time_str or time_str.strip() == '':
-        return None
-    
-    try:
-        return datetime.strptime(time_str.strip(), '%H:%M').time()
-    except ValueError:
-        raise ValueError(f"Invalid time format: {time_str}")
+ASSIGNMENT_OVERLAP_CONSTRAINT = 'ex_assignment_overlap'
+_assignment_overlap_enforced = False
 
-def parse_date(date_str):
-    """Parse date string in DD-MM-YYYY format"""
-    if not date_str:
-        raise ValueError("Date is required")
+def assignment_overlap_enforced():
+    """Whether the database itself rejects overlapping assignments through the exclusion constraint"""
+    global _assignment_overlap_enforced
     
-    try:
-        return datetime.strptime(date_str.strip(), '%d-%m-%Y').date()
-    except ValueError:
-        raise ValueError(f"Invalid date format: {date_str}. Expected DD-MM-YYYY")
+    # create_all never adds the constraint to an existing table, so look for it until it shows up
+    if not _assignment_overlap_enforced and db.engine.dialect.name == 'postgresql':
+        _assignment_overlap_enforced = db.session.execute(
+            db.text("SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = :name "
+                    "AND conrelid = 'assignments'::regclass)"),
+            {'name': ASSIGNMENT_OVERLAP_CONSTRAINT}
+        ).scalar()
+    return _assignment_overlap_enforced
 
-def validate_status(status_str):
-    """Validate attendance status"""
-    valid_statuses = [s.value for s in AttendanceStatus]
-    if status_str not in valid_statuses:
-        raise ValueError(f"Invalid status: {status_str}. Must be one of {valid_statuses}")
-    return status_str
+def is_assignment_overlap_error(error):
+    """Whether an IntegrityError came from the assignment exclusion constraint"""
+    diag = getattr(error.orig, 'diag', None)
+    return getattr(diag, 'constraint_name', None) == ASSIGNMENT_OVERLAP_CONSTRAINT
+
+EXPECTED_COLUMNS = [
+    'EP number', 'Name', 'Company', 'Plant', 'Department', 'Trade', 'Skill',
+    'Date', 'IN1', 'OUT1', 'IN2', 'OUT2', 'IN3', 'OUT3', 
+    'Hours Worked', 'Overtime', 'Status'
+]
+TIME_COLUMNS = ['IN1', 'OUT1', 'IN2', 'OUT2', 'IN3', 'OUT3']
+TIME_FIELDS = [col.lower() for col in TIME_COLUMNS]
+CSV_CHUNK_SIZE = 10000
+IMPORT_UPLOAD_DIR = os.environ.get('IMPORT_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'lams_uploads'))
+IMPORT_ERRORS_KEPT = 1000
+IMPORT_STALE_MINUTES = int(os.environ.get('IMPORT_STALE_MINUTES', 60))
+EXPORT_CACHE_TIMEOUT = 300
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CACHE_MAX_CHARS = 5 * 1024 * 1024
+DASHBOARD_CACHE_TIMEOUT = 300
+SUPERVISOR_DASHBOARD_CACHE_TIMEOUT = 60
+NOTIFICATIONS_CACHE_TIMEOUT = 30
 
-def process_csv_import(file, user_id, commit=False):
+def process_csv_import(file, user_id, commit=False, chunksize=CSV_CHUNK_SIZE, heartbeat=None):
     """Process CSV attendance import"""
+    # Totals as of the last committed chunk, reported if a later chunk fails
+    committed = None
+    
     try:
-        # Read CSV
-        df = pd.read_csv(file)
-        
-        # Expected columns
-        expected_columns = [
-            'EP number', 'Name', 'Company', 'Plant', 'Department', 'Trade', 'Skill',
-            'Date', 'IN1', 'OUT1', 'IN2', 'OUT2', 'IN3', 'OUT3', 
-            'Hours Worked', 'Overtime', 'Status'
-        ]
-        
-        # Check columns
-        missing_columns = [col for col in expected_columns if col not in df.columns]
-        if missing_columns:
-            return {
-                'success': False,
-                'error': f"Missing required columns: {', '.join(missing_columns)}"
-            }
-        
         results = {
             'success': True,
             'summary': {
-                'total_rows': len(df),
+                'total_rows': 0,
                 'valid_rows': 0,
                 'error_rows': 0,
                 'created': 0,
@@ -109,143 +178,400 @@ def process_csv_import(file, user_id, commit=False):
             'errors': []
         }
         
-        for index, row in df.iterrows():
-            try:
-                # Validate required fields
-                ep_number = str(row['EP number']).strip()
-                name = str(row['Name']).strip()
-                company_name = str(row['Company']).strip()
-                date_str = str(row['Date']).strip()
-                status = str(row['Status']).strip()
-                
-                if not ep_number or ep_number == 'nan':
-                    raise ValueError("EP number is required")
-                
-                if not company_name or company_name == 'nan':
-                    raise ValueError("Company is required")
-                
-                # Validate and parse data
-                attendance_date = parse_date(date_str)
-                validate_status(status)
-                
-                # Parse times
-                in1 = parse_time(str(row['IN1']) if not pd.isna(row['IN1']) else '')
-                out1 = parse_time(str(row['OUT1']) if not pd.isna(row['OUT1']) else '')
-                in2 = parse_time(str(row['IN2']) if not pd.isna(row['IN2']) else '')
-                out2 = parse_time(str(row['OUT2']) if not pd.isna(row['OUT2']) else '')
-                in3 = parse_time(str(row['IN3']) if not pd.isna(row['IN3']) else '')
-                out3 = parse_time(str(row['OUT3']) if not pd.isna(row['OUT3']) else '')
-                
-                # Parse hours
-                try:
-                    hours_worked = float(row['Hours Worked']) if not pd.isna(row['Hours Worked']) else 0.0
-                    overtime = float(row['Overtime']) if not pd.isna(row['Overtime']) else 0.0
-                except ValueError:
-                    raise ValueError("Hours Worked and Overtime must be numeric")
-                
-                # Find or create company
-                company = Company.query.filter_by(name=company_name).first()
-                if not company:
-                    raise ValueError(f"Unknown company: {company_name}")
-                
-                if commit:
-                    # Find or create employee
-                    employee = Employee.query.filter_by(
-                        company_id=company.id,
-                        ep_number=ep_number
-                    ).first()
-                    
-                    if not employee:
-                        # Create employee
-                        employee = Employee(
-                            company_id=company.id,
-                            ep_number=ep_number,
-                            name=name,
-                            plant=str(row['Plant']) if not pd.isna(row['Plant']) else '',
-                            department=str(row['Department']) if not pd.isna(row['Department']) else '',
-                            trade=str(row['Trade']) if not pd.isna(row['Trade']) else '',
-                            skill=str(row['Skill']) if not pd.isna(row['Skill']) else ''
-                        )
-                        db.session.add(employee)
-                        db.session.flush()
-                        
-                        # Create employee user account
-                        if not User.query.filter_by(username=ep_number).first():
-                            user = User(
-                                username=ep_number,
-                                ep_number=ep_number,
-                                role=UserRole.EMPLOYEE,
-                                company_id=company.id,
-                                password_hash=generate_password_hash(ep_number),
-                                must_change_password=True
-                            )
-                            db.session.add(user)
-                            db.session.flush()
-                            employee.user_id = user.id
-                    
-                    # Find or create attendance record
-                    attendance = AttendanceRecord.query.filter_by(
-                        employee_id=employee.id,
-                        date=attendance_date
-                    ).first()
-                    
-                    is_new = not attendance
-                    
-                    if not attendance:
-                        attendance = AttendanceRecord(
-                            employee_id=employee.id,
-                            company_id=company.id,
-                            date=attendance_date,
-                            status=AttendanceStatus(status)
-                        )
-                        db.session.add(attendance)
-                        results['summary']['created'] += 1
-                    else:
-                        results['summary']['updated'] += 1
-                    
-                    # Update fields (only non-empty values overwrite existing)
-                    if in1 is not None or is_new:
-                        attendance.in1 = in1
-                    if out1 is not None or is_new:
-                        attendance.out1 = out1
-                    if in2 is not None or is_new:
-                        attendance.in2 = in2
-                    if out2 is not None or is_new:
-                        attendance.out2 = out2
-                    if in3 is not None or is_new:
-                        attendance.in3 = in3
-                    if out3 is not None or is_new:
-                        attendance.out3 = out3
-                    
-                    attendance.hours_worked = hours_worked
-                    attendance.overtime = overtime
-                    attendance.status = AttendanceStatus(status)
-                    attendance.plant = str(row['Plant']) if not pd.isna(row['Plant']) else ''
-                    attendance.department = str(row['Department']) if not pd.isna(row['Department']) else ''
-                    attendance.trade = str(row['Trade']) if not pd.isna(row['Trade']) else ''
-                    attendance.skill = str(row['Skill']) if not pd.isna(row['Skill']) else ''
-                
-                results['summary']['valid_rows'] += 1
-                
-            except Exception as e:
-                results['summary']['error_rows'] += 1
-                results['errors'].append(f"Row {index + 2}: {str(e)}")
+        # Lookups shared by every chunk, loaded once per import
+        companies = dict(Company.query.with_entities(Company.name, Company.id).all())
+        existing_usernames = set()
+        if commit:
+            existing_usernames = {username for (username,) in User.query.with_entities(User.username).all()}
+        
+        # Read CSV in chunks as plain strings so memory stays bounded by the chunk size
+        reader = pd.read_csv(file, chunksize=chunksize, dtype=str, keep_default_na=False)
+        
+        for chunk_number, chunk in enumerate(reader):
+            # Check columns
+            if chunk_number == 0:
+                missing_columns = [col for col in EXPECTED_COLUMNS if col not in chunk.columns]
+                if missing_columns:
+                    return {
+                        'success': False,
+                        'error': f"Missing required columns: {', '.join(missing_columns)}"
+                    }
+            
+            _import_chunk(chunk, results, commit, companies, existing_usernames)
+            
+            # Each chunk is its own transaction so locks and session state don't grow with the file
+            if commit:
+                db.session.commit()
+                committed = (dict(results['summary']), len(results['errors']))
+            
+            if heartbeat:
+                heartbeat()
         
         if commit:
-            db.session.commit()
+            invalidate_exports()
         
         return results
         
     except Exception as e:
         logging.error(f"CSV import error: {str(e)}")
+        if commit:
+            # Chunks before the failing one are already committed
+            db.session.rollback()
+            invalidate_exports()
+            
+            if committed is not None:
+                summary, errors_count = committed
+                return {
+                    'success': False,
+                    'partial': True,
+                    'error': str(e),
+                    'summary': summary,
+                    'errors': results['errors'][:errors_count]
+                }
         return {
             'success': False,
             'error': str(e)
         }
 
+def _threads_are_native():
+    """Whether threads here are OS threads rather than greenlets of a gevent-patched web worker"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return True
+    return not monkey.is_module_patched('threading')
+
+# Under gevent workers a thread pool would run imports on the worker's event loop and stall every
+# request, so jobs are left in import_jobs for import_worker.py. Plain threaded servers run them here.
+import_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('IMPORT_WORKERS', 2))) if _threads_are_native() else None
+
+def start_import_job(file, filename, user_id, mode):
+    """Save an uploaded CSV and queue it as a pending import job"""
+    os.makedirs(IMPORT_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(IMPORT_UPLOAD_DIR, f"{uuid.uuid4().hex}.csv")
+    file.save(path)
+    
+    job = ImportJob(created_by_id=user_id, filename=filename, mode=mode, upload_path=path)
+    db.session.add(job)
+    db.session.commit()
+    
+    if import_executor is not None:
+        import_executor.submit(_drain_import_jobs, current_app._get_current_object())
+    return job
+
+def _drain_import_jobs(app):
+    """Run pending jobs on the local pool, including any a restart left behind"""
+    with app.app_context():
+        fail_stale_import_jobs()
+        while run_next_import_job():
+            pass
+
+def claim_import_job(job_id):
+    """Mark a pending job as running; False if another worker already took it"""
+    claimed = db.session.execute(
+        db.update(ImportJob).where(
+            ImportJob.id == job_id, ImportJob.status == ImportJobStatus.PENDING
+        ).values(status=ImportJobStatus.RUNNING, started_at=datetime.utcnow(), heartbeat_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+def run_next_import_job():
+    """Claim and process the oldest pending job; False when the queue is empty"""
+    job_id = db.session.query(ImportJob.id).filter_by(
+        status=ImportJobStatus.PENDING
+    ).order_by(ImportJob.id).limit(1).scalar()
+    if job_id is None:
+        return False
+    
+    if claim_import_job(job_id):
+        process_import_job(job_id)
+    return True
+
+def process_import_job(job_id):
+    """Process a claimed import and record its outcome on the job"""
+    job = db.session.get(ImportJob, job_id)
+    path = job.upload_path
+    try:
+        commit = job.mode == 'commit'
+        result = process_csv_import(path, job.created_by_id, commit, heartbeat=lambda: _touch_import_job(job_id))
+        
+        # A partial import still wrote its earlier chunks, so it is summarised and audited too
+        if result['success'] or result.get('partial'):
+            job.summary = result['summary']
+            job.errors = result['errors'][:IMPORT_ERRORS_KEPT]
+            if commit:
+                invalidate_dashboard_counts()
+                create_audit_log(job.created_by_id, AuditAction.IMPORT, 'AttendanceRecord', 0,
+                                 {'filename': job.filename, 'job_id': job.id, 'summary': result['summary'],
+                                  'partial': bool(result.get('partial'))})
+        
+        if result['success']:
+            job.status = ImportJobStatus.SUCCEEDED
+        else:
+            job.status = ImportJobStatus.PARTIAL if result.get('partial') else ImportJobStatus.FAILED
+            job.error = result['error']
+        
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        
+    except Exception as e:
+        logging.error(f"Import job {job_id} error: {str(e)}")
+        db.session.rollback()
+        job = db.session.get(ImportJob, job_id)
+        job.status = ImportJobStatus.FAILED
+        job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    
+    finally:
+        _remove_upload(path)
+
+def _touch_import_job(job_id):
+    """Record that a running job is still making progress"""
+    db.session.execute(
+        db.update(ImportJob).where(ImportJob.id == job_id).values(heartbeat_at=datetime.utcnow())
+    )
+    db.session.commit()
+
+def fail_stale_import_jobs(max_age_minutes=IMPORT_STALE_MINUTES):
+    """Fail running jobs whose runner stopped sending heartbeats, and delete their uploads"""
+    # Pending jobs stay queued; the next runner picks them up
+    cutoff = datetime.utcnow() - timedelta(minutes=max_age_minutes)
+    stale_jobs = ImportJob.query.filter(
+        ImportJob.status == ImportJobStatus.RUNNING, ImportJob.heartbeat_at < cutoff
+    ).all()
+    
+    for job in stale_jobs:
+        job.status = ImportJobStatus.FAILED
+        job.error = 'The import was interrupted before it finished. Please upload the file again.'
+        job.finished_at = datetime.utcnow()
+        _remove_upload(job.upload_path)
+    db.session.commit()
+    
+    if stale_jobs:
+        logging.warning(f"Marked {len(stale_jobs)} interrupted import jobs as failed")
+
+def _remove_upload(path):
+    """Delete a saved upload if it is still there"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _import_chunk(df, results, commit, companies, existing_usernames):
+    """Validate one chunk of CSV rows and write the valid ones when committing"""
+    results['summary']['total_rows'] += len(df)
+    
+    # Normalise every column in one pass instead of per cell
+    text = df[EXPECTED_COLUMNS].fillna('').apply(lambda col: col.str.strip())
+    
+    # Parse dates, times and hours column-wise
+    dates = pd.to_datetime(text['Date'], format='%d-%m-%Y', errors='coerce')
+    times = {col: pd.to_datetime(text[col], format='%H:%M', errors='coerce') for col in TIME_COLUMNS}
+    hours_worked = pd.to_numeric(text['Hours Worked'].replace('', '0'), errors='coerce')
+    overtime = pd.to_numeric(text['Overtime'].replace('', '0'), errors='coerce')
+    
+    # Validation rules in priority order; each row reports its first failure
+    valid_statuses = [s.value for s in AttendanceStatus]
+    checks = [
+        (text['EP number'] == '', "EP number is required"),
+        (text['Company'] == '', "Company is required"),
+        (text['Date'] == '', "Date is required"),
+        (dates.isna(), 'Invalid date format: ' + text['Date'] + '. Expected DD-MM-YYYY'),
+        (~text['Status'].isin(valid_statuses), 'Invalid status: ' + text['Status'] + f'. Must be one of {valid_statuses}'),
+    ]
+    for col in TIME_COLUMNS:
+        checks.append((times[col].isna() & (text[col] != ''), 'Invalid time format: ' + text[col]))
+    checks.append((hours_worked.isna() | overtime.isna(), "Hours Worked and Overtime must be numeric"))
+    checks.append((~text['Company'].isin(companies.keys()), 'Unknown company: ' + text['Company']))
+    
+    errors = pd.Series(None, index=df.index, dtype=object)
+    for mask, message in checks:
+        errors = errors.where(errors.notna() | ~mask, message)
+    
+    error_mask = errors.notna()
+    for index, message in errors[error_mask].items():
+        results['errors'].append(f"Row {index + 2}: {message}")
+    results['summary']['error_rows'] += int(error_mask.sum())
+    results['summary']['valid_rows'] += int((~error_mask).sum())
+    
+    valid = ~error_mask
+    valid_rows = pd.DataFrame({
+        'company_id': text.loc[valid, 'Company'].map(companies),
+        'ep_number': text.loc[valid, 'EP number'],
+        'name': text.loc[valid, 'Name'],
+        'date': dates[valid].dt.date,
+        'status': text.loc[valid, 'Status'].map(AttendanceStatus),
+        **{col.lower(): _nullable(times[col][valid].dt.time) for col in TIME_COLUMNS},
+        'hours_worked': hours_worked[valid],
+        'overtime': overtime[valid],
+        'plant': text.loc[valid, 'Plant'],
+        'department': text.loc[valid, 'Department'],
+        'trade': text.loc[valid, 'Trade'],
+        'skill': text.loc[valid, 'Skill'],
+    })
+    
+    if commit and not valid_rows.empty:
+        _write_attendance_rows(valid_rows, results['summary'], existing_usernames)
+
+def _nullable(series):
+    """Convert a parsed column to Python objects with None for missing values"""
+    return series.astype(object).where(series.notna(), None)
+
+def _write_attendance_rows(rows, summary, existing_usernames):
+    """Persist parsed import rows using bulk pre-fetched lookups"""
+    # Pre-load existing employees keyed by natural key
+    employee_keys = set(zip(rows['company_id'], rows['ep_number']))
+    employees = {
+        (e.company_id, e.ep_number): e
+        for e in Employee.query.filter(tuple_(Employee.company_id, Employee.ep_number).in_(employee_keys)).all()
+    }
+    
+    # Existing (employee_id, date) pairs, only needed to report created vs updated
+    attendance_keys = {
+        (employees[(company_id, ep_number)].id, attendance_date)
+        for company_id, ep_number, attendance_date in zip(rows['company_id'], rows['ep_number'], rows['date'])
+        if (company_id, ep_number) in employees
+    }
+    existing_keys = set()
+    if attendance_keys:
+        existing_keys = {
+            tuple(key) for key in db.session.query(AttendanceRecord.employee_id, AttendanceRecord.date).filter(
+                tuple_(AttendanceRecord.employee_id, AttendanceRecord.date).in_(attendance_keys)
+            )
+        }
+    
+    # Hash initial passwords for new employee accounts in one parallel batch
+    new_usernames = sorted({
+        ep_number for company_id, ep_number in employee_keys
+        if (company_id, ep_number) not in employees and ep_number not in existing_usernames
+    })
+    password_hashes = dict(zip(new_usernames, hash_passwords(new_usernames)))
+    
+    # Create missing employees with their user accounts and flush once to get their ids
+    new_employees = []
+    for row in rows.drop_duplicates(subset=['company_id', 'ep_number']).itertuples(index=False):
+        if (row.company_id, row.ep_number) in employees:
+            continue
+        
+        employee = Employee(
+            company_id=row.company_id,
+            ep_number=row.ep_number,
+            name=row.name,
+            plant=row.plant,
+            department=row.department,
+            trade=row.trade,
+            skill=row.skill
+        )
+        
+        # Create employee user account
+        if row.ep_number not in existing_usernames:
+            employee.user_ref = User(
+                username=row.ep_number,
+                ep_number=row.ep_number,
+                role=UserRole.EMPLOYEE,
+                company_id=row.company_id,
+                password_hash=password_hashes[row.ep_number],
+                must_change_password=True
+            )
+            existing_usernames.add(row.ep_number)
+        
+        employees[(row.company_id, row.ep_number)] = employee
+        new_employees.append(employee)
+    
+    if new_employees:
+        db.session.add_all(new_employees)
+        db.session.flush()
+    
+    # Key every row by employee and day, then count new days vs. rewrites of known ones
+    records = rows.drop(columns=['ep_number', 'name']).assign(employee_id=[
+        employees[key].id for key in zip(rows['company_id'], rows['ep_number'])
+    ])
+    keys = ['employee_id', 'date']
+    repeated = records.duplicated(subset=keys)
+    stored = pd.Series([key in existing_keys for key in zip(records['employee_id'], records['date'])], index=records.index)
+    created = int((~repeated & ~stored).sum())
+    summary['created'] += created
+    summary['updated'] += len(records) - created
+    
+    # The last row for a day wins, but a repeated day in the file only overwrites the times it provides
+    upserts = records.drop_duplicates(subset=keys, keep='last').set_index(keys)
+    if repeated.any():
+        upserts[TIME_FIELDS] = records.groupby(keys)[TIME_FIELDS].last()
+        upserts[TIME_FIELDS] = upserts[TIME_FIELDS].apply(_nullable)
+    
+    db.session.execute(_attendance_upsert_statement(), upserts.reset_index().to_dict('records'))
+
+def _attendance_upsert_statement():
+    """Build an INSERT ... ON CONFLICT (employee_id, date) DO UPDATE for attendance rows"""
+    insert = pg_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    stmt = insert(AttendanceRecord)
+    columns = AttendanceRecord.__table__.c
+    
+    return stmt.on_conflict_do_update(
+        index_elements=['employee_id', 'date'],
+        set_={
+            # Empty times in the file keep the stored value
+            **{field: func.coalesce(stmt.excluded[field], columns[field]) for field in TIME_FIELDS},
+            'hours_worked': stmt.excluded.hours_worked,
+            'overtime': stmt.excluded.overtime,
+            'status': stmt.excluded.status,
+            'plant': stmt.excluded.plant,
+            'department': stmt.excluded.department,
+            'trade': stmt.excluded.trade,
+            'skill': stmt.excluded.skill
+        }
+    )
+
+def cache_generation(namespace):
+    """Current generation of a cache namespace; bumping it expires every key built from it"""
+    return cache.get(f"{namespace}:generation") or 0
+
+def bump_cache_generation(namespace):
+    """Start a new generation so keys from the previous one are never read again"""
+    # Atomic INCR so concurrent bumps from different workers are never lost
+    cache.cache.inc(f"{namespace}:generation")
+
+def export_cache_key(user):
+    """Cache key for a user's export, scoped to the current data generation"""
+    return f"export:{cache_generation('export')}:{user.id}"
+
+def invalidate_exports():
+    """Expire every cached export after attendance or assignments change"""
+    try:
+        bump_cache_generation('export')
+    except Exception as e:
+        logging.warning(f"Export cache unavailable: {str(e)}")
+
 def export_attendance_csv(user):
-    """Export attendance data based on user permissions"""
-    query = AttendanceRecord.query
+    """Yield attendance data visible to the user as CSV text, one batch of rows at a time"""
+    # Repeat downloads within the cache window skip the database entirely
+    try:
+        cache_key = export_cache_key(user)
+        data = cache.get(cache_key)
+    except Exception as e:
+        logging.warning(f"Export cache unavailable: {str(e)}")
+        cache_key = data = None
+    
+    if data is not None:
+        yield data
+        return
+    
+    # Fetch plain column tuples in a single JOIN instead of hydrating ORM objects
+    query = db.session.query(
+        Employee.ep_number, Employee.name, Company.name,
+        AttendanceRecord.plant, AttendanceRecord.department, AttendanceRecord.trade, AttendanceRecord.skill,
+        AttendanceRecord.date,
+        AttendanceRecord.in1, AttendanceRecord.out1,
+        AttendanceRecord.in2, AttendanceRecord.out2,
+        AttendanceRecord.in3, AttendanceRecord.out3,
+        AttendanceRecord.hours_worked, AttendanceRecord.overtime, AttendanceRecord.status
+    ).select_from(AttendanceRecord).join(
+        Employee, AttendanceRecord.employee_id == Employee.id
+    ).join(
+        Company, Employee.company_id == Company.id
+    )
     
     # Apply role-based filtering
     if user.role == UserRole.MASTER:
@@ -253,7 +579,7 @@ def export_attendance_csv(user):
         pass
     elif user.role == UserRole.ROOT:
         # Root can export company data
-        query = query.filter_by(company_id=user.company_id)
+        query = query.filter(AttendanceRecord.company_id == user.company_id)
     elif user.role == UserRole.SUPERVISOR:
         # Supervisor can export assigned employees
         if user.supervisor_profile:
@@ -261,48 +587,130 @@ def export_attendance_csv(user):
                 supervisor_id=user.supervisor_profile.id
             ).filter(
                 db.or_(Assignment.end_date.is_(None), Assignment.end_date >= date.today())
-            ).subquery()
+            )
             
             query = query.filter(AttendanceRecord.employee_id.in_(assigned_employee_ids))
     elif user.role == UserRole.EMPLOYEE:
         # Employee can export own data
         if user.employee:
-            query = query.filter_by(employee_id=user.employee.id)
-    
-    # Execute query and build CSV
-    records = query.join(Employee).all()
-    
-    data = []
-    for record in records:
-        employee = record.employee_ref
-        data.append({
-            'EP number': employee.ep_number,
-            'Name': employee.name,
-            'Company': employee.company_ref.name,
-            'Plant': record.plant or '',
-            'Department': record.department or '',
-            'Trade': record.trade or '',
-            'Skill': record.skill or '',
-            'Date': record.date.strftime('%d-%m-%Y'),
-            'IN1': record.in1.strftime('%H:%M') if record.in1 else '',
-            'OUT1': record.out1.strftime('%H:%M') if record.out1 else '',
-            'IN2': record.in2.strftime('%H:%M') if record.in2 else '',
-            'OUT2': record.out2.strftime('%H:%M') if record.out2 else '',
-            'IN3': record.in3.strftime('%H:%M') if record.in3 else '',
-            'OUT3': record.out3.strftime('%H:%M') if record.out3 else '',
-            'Hours Worked': str(record.hours_worked),
-            'Overtime': str(record.overtime),
-            'Status': record.status.value
-        })
-    
-    df = pd.DataFrame(data)
-    
-    # Save to temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.csv')
-    df.to_csv(temp_file.name, index=False)
-    
-    return temp_file.name
+            query = query.filter(AttendanceRecord.employee_id == user.employee.id)
+    
+    # Run the query before the first chunk is produced so failures surface before streaming starts
+    rows = iter(query.yield_per(EXPORT_BATCH_SIZE))
+    
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(EXPECTED_COLUMNS)
+    
+    # Keep a copy for the cache only while the export stays small
+    cached_chunks = [] if cache_key is not None else None
+    cached_size = 0
+    
+    while True:
+        batch = list(islice(rows, EXPORT_BATCH_SIZE))
+        for row in batch:
+            writer.writerow(_format_export_row(row))
+        
+        chunk = output.getvalue()
+        output.seek(0)
+        output.truncate()
+        
+        if cached_chunks is not None:
+            cached_size += len(chunk)
+            if cached_size <= EXPORT_CACHE_MAX_CHARS:
+                cached_chunks.append(chunk)
+            else:
+                cached_chunks = None
+        
+        yield chunk
+        
+        if len(batch) < EXPORT_BATCH_SIZE:
+            break
+    
+    if cached_chunks is not None:
+        try:
+            cache.set(cache_key, ''.join(cached_chunks), timeout=EXPORT_CACHE_TIMEOUT)
+        except Exception as e:
+            logging.warning(f"Export cache unavailable: {str(e)}")
+
+def _format_export_row(row):
+    """Format one exported attendance row in the import template layout"""
+    (ep_number, name, company_name, plant, department, trade, skill, attendance_date,
+     in1, out1, in2, out2, in3, out3, hours_worked, overtime, status) = row
+    return [
+        ep_number, name, company_name,
+        plant or '', department or '', trade or '', skill or '',
+        attendance_date.strftime('%d-%m-%Y'),
+        *(t.strftime('%H:%M') if t else '' for t in (in1, out1, in2, out2, in3, out3)),
+        str(hours_worked), str(overtime), status.value
+    ]
 
+class KeysetPage:
+    """One page of rows ordered newest first, with cursors to the neighbouring pages"""
+    
+    def __init__(self, items, has_newer, has_older):
+        self.items = items
+        self.has_newer = has_newer
+        self.has_older = has_older
+    
+    @property
+    def newer_cursor(self):
+        return self.items[0].id if self.items else None
+    
+    @property
+    def older_cursor(self):
+        return self.items[-1].id if self.items else None
+
+def keyset_paginate(query, id_column, before=None, after=None, per_page=50):
+    """Page through a query by id instead of OFFSET, so no COUNT(*) over the whole result is needed"""
+    if after is not None:
+        # Walking back towards newer rows: read upwards from the cursor, then flip into display order
+        items = query.filter(id_column > after).order_by(id_column.asc()).limit(per_page + 1).all()
+        return KeysetPage(items[:per_page][::-1], has_newer=len(items) > per_page, has_older=True)
+    
+    if before is not None:
+        query = query.filter(id_column < before)
+    items = query.order_by(id_column.desc()).limit(per_page + 1).all()
+    return KeysetPage(items[:per_page], has_newer=before is not None, has_older=len(items) > per_page)
+
+@cache.memoize(timeout=NOTIFICATIONS_CACHE_TIMEOUT)
 def get_unread_notifications_count(user_id: int) -> int:
     """Get count of unread notifications for a user"""
-    return Notification.query.filter_by(recipient_id=user_id).filter(Notification.read_at.is_(None)).count()
+    return db.session.execute(
+        select(func.count()).select_from(Notification).where(
+            Notification.recipient_id == user_id,
+            Notification.read_at.is_(None)
+        )
+    ).scalar()
+
+def invalidate_unread_notifications_count(user_id: int):
+    """Drop a user's cached unread count after notifications are created or read"""
+    try:
+        cache.delete_memoized(get_unread_notifications_count, user_id)
+    except Exception as e:
+        logging.warning(f"Notifications cache unavailable: {str(e)}")
+
+def cached_dashboard_counts(key, compute, timeout=DASHBOARD_CACHE_TIMEOUT):
+    """Return dashboard counts from the cache, falling back to the database if the cache is down"""
+    try:
+        cache_key = f"dash:{cache_generation('dash')}:{key}"
+        counts = cache.get(cache_key)
+    except Exception as e:
+        logging.warning(f"Dashboard cache unavailable: {str(e)}")
+        return compute()
+    
+    if counts is None:
+        counts = compute()
+        try:
+            cache.set(cache_key, counts, timeout=timeout)
+        except Exception as e:
+            logging.warning(f"Dashboard cache unavailable: {str(e)}")
+    
+    return counts
+
+def invalidate_dashboard_counts():
+    """Expire cached dashboard counts after companies, users, assignments or attendance change"""
+    try:
+        bump_cache_generation('dash')
+    except Exception as e:
+        logging.warning(f"Dashboard cache unavailable: {str(e)}")
@@ -1,62 +1,94 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, g, Response, stream_with_context
 from flask_login import login_required, current_user
-from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
 from models import *
 from app import db
-from utils import requires_role, get_user_companies, create_audit_log, process_csv_import, export_attendance_csv, get_unread_notifications_count
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from utils import hash_password, requires_role, get_user_companies, create_audit_log, start_import_job, export_attendance_csv, invalidate_exports, get_unread_notifications_count, invalidate_unread_notifications_count, cached_dashboard_counts, invalidate_dashboard_counts, keyset_paginate, assignment_overlap_enforced, is_assignment_overlap_error, SUPERVISOR_DASHBOARD_CACHE_TIMEOUT, EXPECTED_COLUMNS
 import logging
-import pandas as pd
+import csv
+import hashlib
+from itertools import chain
 from datetime import datetime, date
 import io
 import os
 
 views_bp = Blueprint('views', __name__)
 
+@views_bp.app_context_processor
+def inject_notifications_count():
+    """Expose the unread notification count to every template, computed at most once per request"""
+    if not current_user.is_authenticated:
+        return {}
+    if 'notifications_count' not in g:
+        g.notifications_count = get_unread_notifications_count(current_user.id)
+    return {'notifications': g.notifications_count}
+
 @views_bp.route('/')
 @login_required
 def dashboard():
     """Role-based dashboard"""
     context = {
-        'user': current_user,
-        'notifications': get_unread_notifications_count(current_user.id)
+        'user': current_user
     }
     
     if current_user.role == UserRole.MASTER:
+        # Both counts come back in one round-trip as scalar subselects
+        context.update(cached_dashboard_counts('master', lambda: db.session.execute(db.select(
+            db.select(db.func.count(Company.id)).scalar_subquery().label('companies_count'),
+            db.select(db.func.count(User.id)).scalar_subquery().label('users_count')
+        )).one()._asdict()))
         context.update({
-            'companies_count': Company.query.count(),
-            'users_count': User.query.count(),
-            'recent_imports': AuditLog.query.filter_by(action=AuditAction.IMPORT).limit(5).all()
+            'recent_imports': AuditLog.query.options(joinedload(AuditLog.actor_ref)).filter_by(
+                action=AuditAction.IMPORT
+            ).limit(5).all()
         })
     
     elif current_user.role == UserRole.ROOT:
         if current_user.company_id:
-            company = Company.query.get(current_user.company_id)
-            context.update({
-                'company': company,
-                'employees_count': Employee.query.filter_by(company_id=current_user.company_id).count(),
-                'supervisors_count': User.query.filter_by(company_id=current_user.company_id, role=UserRole.SUPERVISOR).count()
-            })
+            # Already loaded alongside the user by USER_LOAD_OPTIONS
+            context['company'] = current_user.company_ref
+            context.update(cached_dashboard_counts(f'root:{current_user.company_id}', lambda: db.session.execute(db.select(
+                db.select(db.func.count(Employee.id)).where(
+                    Employee.company_id == current_user.company_id
+                ).scalar_subquery().label('employees_count'),
+                db.select(db.func.count(User.id)).where(
+                    User.company_id == current_user.company_id, User.role == UserRole.SUPERVISOR
+                ).scalar_subquery().label('supervisors_count')
+            )).one()._asdict()))
     
     elif current_user.role == UserRole.SUPERVISOR:
         if current_user.supervisor_profile:
-            assigned_employees = db.session.query(Employee).join(Assignment).filter(
-                Assignment.supervisor_id == current_user.supervisor_profile.id,
-                db.or_(Assignment.end_date.is_(None), Assignment.end_date >= date.today())
-            ).count()
+            profile_id = current_user.supervisor_profile.id
+            today = date.today()
             
-            context.update({
-                'assigned_employees': assigned_employees,
-                'today_attendance': AttendanceRecord.query.filter_by(date=date.today()).count()
-            })
+            # Both counts in one round-trip; today's attendance only covers this supervisor's employees
+            active_assignment = (
+                Assignment.supervisor_id == profile_id,
+                db.or_(Assignment.end_date.is_(None), Assignment.end_date >= today)
+            )
+            supervisor_counts = lambda: db.session.execute(db.select(
+                db.select(db.func.count(db.distinct(Assignment.employee_id))).where(
+                    *active_assignment
+                ).scalar_subquery().label('assigned_employees'),
+                db.select(db.func.count(1)).select_from(AttendanceRecord).where(
+                    AttendanceRecord.date == today,
+                    AttendanceRecord.employee_id.in_(db.select(Assignment.employee_id).where(*active_assignment))
+                ).scalar_subquery().label('today_attendance')
+            )).one()._asdict()
+            
+            context.update(cached_dashboard_counts(f'supervisor:{profile_id}:{today}', supervisor_counts,
+                                                   timeout=SUPERVISOR_DASHBOARD_CACHE_TIMEOUT))
     
     elif current_user.role == UserRole.EMPLOYEE:
         if current_user.employee:
             context.update({
                 'employee': current_user.employee,
-                'this_month_records': current_user.employee.attendance_records.filter(
+                'this_month_records': db.session.query(db.func.count(1)).select_from(AttendanceRecord).filter(
+                    AttendanceRecord.employee_id == current_user.employee.id,
                     AttendanceRecord.date >= date.today().replace(day=1)
-                ).count()
+                ).scalar()
             })
     
     return render_template('dashboard.html', **context)
@@ -66,9 +98,10 @@ def dashboard():
 @requires_role(UserRole.MASTER)
 def companies():
     companies = Company.query.all()
-    from utils import get_unread_notifications_count
-    notifications = get_unread_notifications_count(current_user.id)
-    return render_template('master/companies.html', companies=companies, notifications=notifications)
+    employee_counts = dict(
+        db.session.query(Employee.company_id, db.func.count(Employee.id)).group_by(Employee.company_id).all()
+    )
+    return render_template('master/companies.html', companies=companies, employee_counts=employee_counts)
 
 @views_bp.route('/companies/create', methods=['POST'])
 @requires_role(UserRole.MASTER)
@@ -79,13 +112,14 @@ def create_company():
         flash('Company name is required.', 'error')
         return redirect(url_for('views.companies'))
     
-    if Company.query.filter_by(name=name).first():
+    if db.session.query(Company.query.filter_by(name=name).exists()).scalar():
         flash('Company with this name already exists.', 'error')
         return redirect(url_for('views.companies'))
     
     company = Company(name=name)
     db.session.add(company)
     db.session.commit()
+    invalidate_dashboard_counts()
     
     create_audit_log(current_user.id, AuditAction.CREATE, 'Company', company.id, {'name': name})
     flash(f'Company "{name}" created successfully.', 'success')
@@ -94,10 +128,9 @@ def create_company():
 @views_bp.route('/users')
 @requires_role(UserRole.MASTER)
 def master_users():
-    users = User.query.filter(User.role != UserRole.MASTER).all()
+    users = User.query.options(joinedload(User.company_ref)).filter(User.role != UserRole.MASTER).all()
     companies = Company.query.all()
-    notifications = get_unread_notifications_count(current_user.id)
-    return render_template('master/users.html', users=users, companies=companies, notifications=notifications)
+    return render_template('master/users.html', users=users, companies=companies)
 
 @views_bp.route('/users/create-root', methods=['POST'])
 @requires_role(UserRole.MASTER)
@@ -109,11 +142,11 @@ def create_root_user():
         flash('Username and company are required.', 'error')
         return redirect(url_for('views.master_users'))
     
-    if User.query.filter_by(username=username).first():
+    if db.session.query(User.query.filter_by(username=username).exists()).scalar():
         flash('Username already exists.', 'error')
         return redirect(url_for('views.master_users'))
     
-    company = Company.query.get(company_id)
+    company = db.session.get(Company, company_id)
     if not company:
         flash('Invalid company selected.', 'error')
         return redirect(url_for('views.master_users'))
@@ -122,11 +155,12 @@ def create_root_user():
         username=username,
         role=UserRole.ROOT,
         company_id=company_id,
-        password_hash=generate_password_hash(username),  # Initial password = username
+        password_hash=hash_password(username),  # Initial password = username
         must_change_password=True
     )
     db.session.add(user)
     db.session.commit()
+    invalidate_dashboard_counts()
     
     create_audit_log(current_user.id, AuditAction.CREATE, 'User', user.id, 
                     {'username': username, 'role': 'ROOT', 'company': company.name})
@@ -136,46 +170,41 @@ def create_root_user():
 @views_bp.route('/import-attendance')
 @requires_role(UserRole.MASTER)
 def import_attendance():
-    notifications = get_unread_notifications_count(current_user.id)
-    return render_template('master/import.html', notifications=notifications)
+    return render_template('master/import.html')
+
+def _build_template_bytes():
+    """Render the import template CSV: the expected header plus two sample rows"""
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(EXPECTED_COLUMNS)
+    writer.writerow(['EP001', 'John Doe', 'Company A', 'Plant1', 'Assembly', 'Welder', 'Skilled', '22-08-2025',
+                     '09:00', '13:00', '14:00', '18:00', '', '', '8.00', '1.00', 'P'])
+    writer.writerow(['EP002', 'Jane Smith', 'Company A', 'Plant1', 'Assembly', 'Fitter', 'Semi', '22-08-2025',
+                     '09:00', '13:00', '14:00', '18:00', '', '', '8.00', '0.00', 'P'])
+    return output.getvalue().encode('utf-8')
+
+# The template never changes, so build it once at import
+_TEMPLATE_BYTES = _build_template_bytes()
+_TEMPLATE_ETAG = hashlib.sha256(_TEMPLATE_BYTES).hexdigest()
+TEMPLATE_MAX_AGE = 86400
 
 @views_bp.route('/download-template')
 @requires_role(UserRole.MASTER)
 def download_template():
     """Download CSV template"""
-    template_data = {
-        'EP number': ['EP001', 'EP002'],
-        'Name': ['John Doe', 'Jane Smith'],
-        'Company': ['Company A', 'Company A'],
-        'Plant': ['Plant1', 'Plant1'],
-        'Department': ['Assembly', 'Assembly'],
-        'Trade': ['Welder', 'Fitter'],
-        'Skill': ['Skilled', 'Semi'],
-        'Date': ['22-08-2025', '22-08-2025'],
-        'IN1': ['09:00', '09:00'],
-        'OUT1': ['13:00', '13:00'],
-        'IN2': ['14:00', '14:00'],
-        'OUT2': ['18:00', '18:00'],
-        'IN3': ['', ''],
-        'OUT3': ['', ''],
-        'Hours Worked': ['8.00', '8.00'],
-        'Overtime': ['1.00', '0.00'],
-        'Status': ['P', 'P']
-    }
-    
-    df = pd.DataFrame(template_data)
-    
-    # Create in-memory file
-    output = io.BytesIO()
-    df.to_csv(output, index=False)
-    output.seek(0)
-    
-    return send_file(
-        io.BytesIO(output.read()),
+    # Browsers reuse their copy for a day, then revalidate against the ETag and get a 304
+    response = send_file(
+        io.BytesIO(_TEMPLATE_BYTES),
         mimetype='text/csv',
         as_attachment=True,
-        download_name='attendance_template.csv'
+        download_name='attendance_template.csv',
+        etag=_TEMPLATE_ETAG,
+        max_age=TEMPLATE_MAX_AGE
     )
+    # Private so shared caches can't hand it out past the role check
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 @views_bp.route('/upload-csv', methods=['POST'])
 @requires_role(UserRole.MASTER)
@@ -190,35 +219,33 @@ def upload_csv():
         return redirect(url_for('views.import_attendance'))
     
     mode = request.form.get('mode', 'validate')  # validate or commit
+    if mode not in ('validate', 'commit'):
+        mode = 'validate'
     
     try:
-        result = process_csv_import(file, current_user.id, mode == 'commit')
-        
-        if result['success']:
-            if mode == 'validate':
-                flash(f'Validation complete. {result["summary"]["valid_rows"]} valid rows, {result["summary"]["error_rows"]} errors.', 'info')
-            else:
-                flash(f'Import successful! Created: {result["summary"]["created"]}, Updated: {result["summary"]["updated"]}, Errors: {result["summary"]["error_rows"]}', 'success')
-                create_audit_log(current_user.id, AuditAction.IMPORT, 'AttendanceRecord', 0, 
-                               {'filename': secure_filename(file.filename or 'unknown.csv'), 'summary': result['summary']})
-        else:
-            flash(f'Import failed: {result["error"]}', 'error')
-            
+        job = start_import_job(file, secure_filename(file.filename) or 'unknown.csv', current_user.id, mode)
     except Exception as e:
         logging.error(f"CSV import error: {str(e)}")
         flash(f'Import failed: {str(e)}', 'error')
+        return redirect(url_for('views.import_attendance'))
     
-    return redirect(url_for('views.import_attendance'))
+    flash(f'Import started (job {job.id}).', 'info')
+    return redirect(url_for('views.import_status', job_id=job.id))
+
+@views_bp.route('/import-status/<int:job_id>')
+@requires_role(UserRole.MASTER)
+def import_status(job_id):
+    job = db.get_or_404(ImportJob, job_id)
+    return render_template('master/import_status.html', job=job)
 
 @views_bp.route('/audit')
 @requires_role(UserRole.MASTER)
 def audit():
-    page = request.args.get('page', 1, type=int)
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).paginate(
-        page=page, per_page=50, error_out=False
-    )
-    notifications = get_unread_notifications_count(current_user.id)
-    return render_template('master/audit.html', logs=logs, notifications=notifications)
+    logs = keyset_paginate(AuditLog.query.options(joinedload(AuditLog.actor_ref)), AuditLog.id,
+                           before=request.args.get('before', type=int),
+                           after=request.args.get('after', type=int),
+                           per_page=50)
+    return render_template('master/audit.html', logs=logs)
 
 # Root User Views
 @views_bp.route('/supervisors')
@@ -228,8 +255,7 @@ def supervisors():
         company_id=current_user.company_id, 
         role=UserRole.SUPERVISOR
     ).all()
-    notifications = get_unread_notifications_count(current_user.id)
-    return render_template('root/supervisors.html', supervisors=supervisors, notifications=notifications)
+    return render_template('root/supervisors.html', supervisors=supervisors)
 
 @views_bp.route('/supervisors/create', methods=['POST'])
 @requires_role(UserRole.ROOT)
@@ -241,16 +267,16 @@ def create_supervisor():
         return redirect(url_for('views.supervisors'))
     
     # Check if EP exists as employee
-    employee = Employee.query.filter_by(
+    employee_exists = db.session.query(Employee.query.filter_by(
         company_id=current_user.company_id, 
         ep_number=ep_number
-    ).first()
+    ).exists()).scalar()
     
-    if not employee:
+    if not employee_exists:
         flash('Employee with this EP number does not exist.', 'error')
         return redirect(url_for('views.supervisors'))
     
-    if User.query.filter_by(username=ep_number).first():
+    if db.session.query(User.query.filter_by(username=ep_number).exists()).scalar():
         flash('User with this EP number already exists.', 'error')
         return redirect(url_for('views.supervisors'))
     
@@ -260,7 +286,7 @@ def create_supervisor():
         ep_number=ep_number,
         role=UserRole.SUPERVISOR,
         company_id=current_user.company_id,
-        password_hash=generate_password_hash(ep_number),
+        password_hash=hash_password(ep_number),
         must_change_password=True
     )
     db.session.add(user)
@@ -273,6 +299,7 @@ def create_supervisor():
     )
     db.session.add(profile)
     db.session.commit()
+    invalidate_dashboard_counts()
     
     create_audit_log(current_user.id, AuditAction.CREATE, 'User', user.id, 
                     {'username': ep_number, 'role': 'SUPERVISOR'})
@@ -283,9 +310,17 @@ def create_supervisor():
 @requires_role(UserRole.ROOT)
 def assignments():
     employees = Employee.query.filter_by(company_id=current_user.company_id).all()
-    supervisors = db.session.query(User, SupervisorProfile).join(SupervisorProfile).filter(
+    # The supervisor list only needs a few columns, not full User and SupervisorProfile entities
+    supervisors = db.session.query(
+        User.id, User.username, User.ep_number, SupervisorProfile.id.label('profile_id')
+    ).join(SupervisorProfile, SupervisorProfile.user_id == User.id).filter(
         User.company_id == current_user.company_id
     ).all()
+    assignment_counts = dict(
+        db.session.query(Assignment.supervisor_id, db.func.count(Assignment.id)).filter(
+            Assignment.supervisor_id.in_([supervisor.profile_id for supervisor in supervisors])
+        ).group_by(Assignment.supervisor_id).all()
+    )
     
     # Get current assignments  
     current_assignments = db.session.query(Assignment, Employee, User).select_from(Assignment).join(
@@ -297,12 +332,11 @@ def assignments():
         db.or_(Assignment.end_date.is_(None), Assignment.end_date >= date.today())
     ).all()
     
-    notifications = get_unread_notifications_count(current_user.id)
     return render_template('root/assignments.html', 
                          employees=employees, 
                          supervisors=supervisors,
-                         current_assignments=current_assignments,
-                         notifications=notifications)
+                         assignment_counts=assignment_counts,
+                         current_assignments=current_assignments)
 
 @views_bp.route('/assignments/create', methods=['POST'])
 @requires_role(UserRole.ROOT)
@@ -324,17 +358,18 @@ def create_assignment():
             flash('End date cannot be before start date.', 'error')
             return redirect(url_for('views.assignments'))
         
-        # Check for overlapping assignments
-        query = Assignment.query.filter_by(employee_id=employee_id).filter(
-            db.or_(Assignment.end_date.is_(None), Assignment.end_date >= start_date)
-        )
-        
-        if end_date:
-            query = query.filter(Assignment.start_date <= end_date)
-        
-        if query.first():
-            flash('This employee already has an overlapping assignment.', 'error')
-            return redirect(url_for('views.assignments'))
+        # Where the exclusion constraint exists the database rejects overlaps; otherwise check up front
+        if not assignment_overlap_enforced():
+            query = Assignment.query.filter_by(employee_id=employee_id).filter(
+                db.or_(Assignment.end_date.is_(None), Assignment.end_date >= start_date)
+            )
+            
+            if end_date:
+                query = query.filter(Assignment.start_date <= end_date)
+            
+            if db.session.query(query.exists()).scalar():
+                flash('This employee already has an overlapping assignment.', 'error')
+                return redirect(url_for('views.assignments'))
         
         assignment = Assignment(
             employee_id=employee_id,
@@ -344,7 +379,16 @@ def create_assignment():
             created_by_id=current_user.id
         )
         db.session.add(assignment)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if not is_assignment_overlap_error(e):
+                raise
+            flash('This employee already has an overlapping assignment.', 'error')
+            return redirect(url_for('views.assignments'))
+        invalidate_exports()
+        invalidate_dashboard_counts()
         
         create_audit_log(current_user.id, AuditAction.CREATE, 'Assignment', assignment.id,
                         {'employee_id': employee_id, 'supervisor_id': supervisor_id})
@@ -380,7 +424,10 @@ def supervisor_attendance():
     date_to = request.args.get('date_to')
     
     if status_filter:
-        assigned_query = assigned_query.filter(AttendanceRecord.status == status_filter)
+        try:
+            assigned_query = assigned_query.filter(AttendanceRecord.status == AttendanceStatus(status_filter))
+        except ValueError:
+            pass
     if date_from:
         try:
             date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
@@ -397,13 +444,11 @@ def supervisor_attendance():
     page = request.args.get('page', 1, type=int)
     records = assigned_query.paginate(page=page, per_page=20, error_out=False)
     
-    notifications = get_unread_notifications_count(current_user.id)
     return render_template('supervisor/attendance.html', 
                          records=records,
                          status_filter=status_filter,
                          date_from=date_from,
-                         date_to=date_to,
-                         notifications=notifications)
+                         date_to=date_to)
 
 # Employee Views
 @views_bp.route('/my-records')
@@ -415,32 +460,33 @@ def employee_records():
     
     # Monthly summary
     current_month_start = date.today().replace(day=1)
-    monthly_records = current_user.employee.attendance_records.filter(
+    status_counts = db.session.query(AttendanceRecord.status, db.func.count(AttendanceRecord.id)).filter(
+        AttendanceRecord.employee_id == current_user.employee.id,
         AttendanceRecord.date >= current_month_start
-    ).all()
+    ).group_by(AttendanceRecord.status).all()
     
-    status_summary = {}
-    for status in AttendanceStatus:
-        status_summary[status.value] = sum(1 for r in monthly_records if r.status == status)
+    status_summary = {status.value: 0 for status in AttendanceStatus}
+    status_summary.update({status.value: count for status, count in status_counts})
     
     # Get filtered records
     status_filter = request.args.get('status')
-    query = current_user.employee.attendance_records
+    query = AttendanceRecord.query.filter_by(employee_id=current_user.employee.id)
     
     if status_filter:
-        query = query.filter(AttendanceRecord.status == status_filter)
+        try:
+            query = query.filter(AttendanceRecord.status == AttendanceStatus(status_filter))
+        except ValueError:
+            pass
     
     page = request.args.get('page', 1, type=int)
     records = query.order_by(AttendanceRecord.date.desc()).paginate(
         page=page, per_page=20, error_out=False
     )
     
-    notifications = get_unread_notifications_count(current_user.id)
     return render_template('employee/records.html',
                          records=records,
                          status_summary=status_summary,
-                         status_filter=status_filter,
-                         notifications=notifications)
+                         status_filter=status_filter)
 
 # Common Views
 @views_bp.route('/export')
@@ -448,8 +494,14 @@ def employee_records():
 def export_data():
     """Export attendance data based on user role and permissions"""
     try:
-        filename = export_attendance_csv(current_user)
-        return send_file(filename, as_attachment=True)
+        # Pull the first chunk here so query errors still redirect instead of breaking the download
+        chunks = export_attendance_csv(current_user)
+        first_chunk = next(chunks)
+        return Response(
+            stream_with_context(chain([first_chunk], chunks)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=attendance_export.csv'}
+        )
     except Exception as e:
         logging.error(f"Export error: {str(e)}")
         flash('Failed to export data.', 'error')
@@ -458,7 +510,7 @@ def export_data():
 @views_bp.route('/add-remark/<int:attendance_id>', methods=['POST'])
 @login_required
 def add_remark(attendance_id):
-    record = AttendanceRecord.query.get_or_404(attendance_id)
+    record = db.get_or_404(AttendanceRecord, attendance_id)
     text = request.form.get('remark', '').strip()
     
     if not text:
@@ -467,19 +519,17 @@ def add_remark(attendance_id):
     
     # Check permissions
     can_add = False
-    if current_user.role == UserRole.EMPLOYEE and record.employee.user_id == current_user.id:
+    if current_user.role == UserRole.EMPLOYEE and record.employee_ref.user_id == current_user.id:
         can_add = True
     elif current_user.role == UserRole.SUPERVISOR:
         # Check if this employee is assigned to current supervisor
-        assignment = Assignment.query.filter_by(
+        can_add = db.session.query(Assignment.query.filter_by(
             employee_id=record.employee_id,
             supervisor_id=current_user.supervisor_profile.id
         ).filter(
             Assignment.start_date <= record.date,
             db.or_(Assignment.end_date.is_(None), Assignment.end_date >= record.date)
-        ).first()
-        if assignment:
-            can_add = True
+        ).exists()).scalar()
     
     if not can_add:
         flash('You do not have permission to add remarks to this record.', 'error')
@@ -492,8 +542,11 @@ def add_remark(attendance_id):
     )
     db.session.add(remark)
     
-    # Update remarks count
-    record.remarks_count = record.remarks.count() + 1
+    # Increment in SQL so concurrent remarks can't overwrite each other's count
+    AttendanceRecord.query.filter_by(id=attendance_id).update(
+        {AttendanceRecord.remarks_count: AttendanceRecord.remarks_count + 1},
+        synchronize_session=False
+    )
     db.session.commit()
     
     flash('Remark added successfully.', 'success')
@@ -502,13 +555,12 @@ def add_remark(attendance_id):
 @views_bp.route('/notifications')
 @login_required
 def notifications():
-    page = request.args.get('page', 1, type=int)
-    notifications = current_user.notifications.order_by(
-        Notification.created_at.desc()
-    ).paginate(page=page, per_page=20, error_out=False)
+    notifications = keyset_paginate(Notification.query.filter_by(recipient_id=current_user.id), Notification.id,
+                                    before=request.args.get('before', type=int),
+                                    after=request.args.get('after', type=int),
+                                    per_page=20)
     
-    notifications_count = get_unread_notifications_count(current_user.id)
-    return render_template('notifications.html', notifications=notifications_count, notifications_list=notifications)
+    return render_template('notifications.html', notifications_list=notifications)
 
 @views_bp.route('/notifications/<int:notification_id>/read', methods=['POST'])
 @login_required
@@ -520,5 +572,6 @@ def mark_notification_read(notification_id):
     
     notification.read_at = datetime.utcnow()
     db.session.commit()
+    invalidate_unread_notifications_count(current_user.id)
     
     return redirect(request.referrer or url_for('views.notifications'))
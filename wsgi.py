@@ -0,0 +1,12 @@
+# Patch the standard library before anything imports sockets, threads or psycopg2
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+# Make psycopg2 wait on the gevent hub so PostgreSQL queries yield the greenlet
+if os.environ.get("DATABASE_URL", "").startswith("postgres"):
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+from app import app